@@ -5,20 +5,480 @@ Handles core patches, extra patches, inox patchset, domain substitution, and pru
 """
 
 import argparse
+import bisect
+import functools
+import hashlib
 import logging
+import mmap
 import os
+import pickle
 import shutil
+import stat
 import subprocess
 import sys
+import tempfile
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
 from pathlib import Path
 import json
 import re
 
+logger = logging.getLogger(__name__)
+
+@functools.lru_cache(maxsize=None)
+def _read_list_cached(path_str, _mtime_ns):
+    """Parse a list file into a tuple of non-comment bytes lines"""
+    with open(path_str, 'rb') as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                lines = bytes(mm).splitlines()
+        except ValueError:
+            return ()
+    return tuple(line for line in (raw.strip() for raw in lines)
+                 if line and not line.startswith(b'#'))
+
+def _read_list(path):
+    """Read a list file, cached on path+mtime so re-reads are free
+
+    The series, pruning and substitution lists are each read more than
+    once across a run_all pass; this parses each at most once per
+    on-disk version. Lines come back as bytes — decode at use sites
+    that need path or text semantics.
+    """
+    return _read_list_cached(str(path), os.stat(path).st_mtime_ns)
+
+# Paths touched by a patch, from its "diff --git a/... b/..." headers
+_DIFF_PATHS_RE = re.compile(rb"^diff --git a/(\S+) b/(\S+)", re.MULTILINE)
+
+def _patch_touched_paths(patch_path):
+    """Return the set of tree paths a patch modifies (empty if unparseable)"""
+    paths = set()
+    try:
+        for a_path, b_path in _DIFF_PATHS_RE.findall(patch_path.read_bytes()):
+            paths.add(a_path)
+            paths.add(b_path)
+    except OSError:
+        pass
+    return paths
+
+# Directories at least this big are handed to rm -rf instead of being
+# walked in-process
+_RM_SUBPROCESS_MIN_ENTRIES = 16
+
+def _dir_entry_count(root, cap):
+    """Count a directory's entries, stopping early at cap"""
+    count = 0
+    try:
+        with os.scandir(root) as entries:
+            for _ in entries:
+                count += 1
+                if count >= cap:
+                    break
+    except OSError:
+        pass
+    return count
+
+def _prune_tree_fd(dir_fd, executor=None):
+    """Remove everything under an open directory fd, bottom-up
+
+    With an executor, file unlinks are fanned out across its threads —
+    the GIL is released around os.unlink, so parallel issuance overlaps
+    kernel-side metadata work. All unlinks are awaited before returning
+    so the caller's rmdir sees an empty directory.
+    """
+    futures = []
+    with os.scandir(dir_fd) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                child_fd = os.open(entry.name,
+                                   os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW,
+                                   dir_fd=dir_fd)
+                try:
+                    _prune_tree_fd(child_fd, executor)
+                finally:
+                    os.close(child_fd)
+                os.rmdir(entry.name, dir_fd=dir_fd)
+            elif executor is not None:
+                futures.append(
+                    executor.submit(os.unlink, entry.name, dir_fd=dir_fd))
+            else:
+                os.unlink(entry.name, dir_fd=dir_fd)
+    for future in futures:
+        future.result()
+
+def _prune_tree(root, executor=None):
+    """Remove a directory tree with dir_fd-relative unlink/rmdir
+
+    shutil.rmtree resolves the full path for every entry it removes,
+    so the kernel re-walks the whole prefix per file. Opening each
+    directory once and issuing unlink/rmdir relative to its fd does
+    that resolution once per directory instead, and scandir's dirents
+    already carry the file type so no per-entry stat is needed.
+    """
+    # A symlinked prune target is removed as a link, never descended
+    # into — following it would delete the target's contents, possibly
+    # outside the chromium tree (shutil.rmtree refuses symlinks too)
+    if os.path.islink(root):
+        os.unlink(root)
+        return
+
+    # Big subtrees (third_party checkouts and the like) go to a single
+    # rm -rf: coreutils unrolls the walk with no per-entry interpreter
+    # overhead, and one fork is cheap against tens of thousands of
+    # PyObject round trips. Small directories stay in-process where the
+    # fork would cost more than it saves.
+    if (os.name == 'posix' and _dir_entry_count(
+            root, _RM_SUBPROCESS_MIN_ENTRIES) >= _RM_SUBPROCESS_MIN_ENTRIES):
+        result = subprocess.run(["rm", "-rf", "--", str(root)],
+                                capture_output=True)
+        if result.returncode == 0:
+            return
+        logger.debug(f"rm -rf failed for {root}, removing in-process")
+
+    if os.unlink not in os.supports_dir_fd or os.scandir not in os.supports_fd:
+        shutil.rmtree(root)
+        return
+    # O_NOFOLLOW guards the islink check against a racing link swap
+    try:
+        dir_fd = os.open(root, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW)
+    except OSError:
+        # ELOOP/ENOTDIR: the root became a symlink after the check
+        os.unlink(root)
+        return
+    try:
+        _prune_tree_fd(dir_fd, executor)
+    finally:
+        os.close(dir_fd)
+    os.rmdir(root)
+
+# Leading lookaround groups carry no literal text and are skipped when
+# extracting a rule's literal prefix
+_LOOKAROUND_PREFIX_RE = re.compile(r"^\(\?<?[=!][^)]*\)")
+
+def _literal_prefix(pattern):
+    """Extract the leading literal text of a regex pattern ('' if none)"""
+    pattern = _LOOKAROUND_PREFIX_RE.sub('', pattern)
+    chars = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\' and i + 1 < len(pattern) and pattern[i + 1] == '.':
+            chars.append('.')
+            i += 2
+            continue
+        if c in '\\^$.|?*+()[]{}':
+            break
+        chars.append(c)
+        i += 1
+    return ''.join(chars)
+
+def _as_literal(pattern):
+    """Return the pattern's plain text if it is literal-only, else None"""
+    chars = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\' and i + 1 < len(pattern) and pattern[i + 1] == '.':
+            chars.append('.')
+            i += 2
+            continue
+        if c in '\\^$.|?*+()[]{}':
+            return None
+        chars.append(c)
+        i += 1
+    return ''.join(chars)
+
+def _compile_domain_rules(regex_lines):
+    """Parse and fuse the domain regex list into one compiled alternation
+
+    Compiling each rule per file and running one re.sub pass per rule
+    made the substitution O(files x rules) with recompilation on every
+    file. The rules are parsed once, each wrapped in a named group, and
+    joined into a single pattern so every file takes exactly one scan.
+    Backreferences inside replacements are renumbered to the fused
+    group indices so \\g<N> templates keep working.
+
+    Rules whose pattern is plain text (no metacharacters beyond escaped
+    dots) and whose replacement has no backreferences skip the regex
+    engine entirely: they go into literal_pairs for a bytes.replace
+    pass, which is a C-level substring scan per rule.
+
+    Returns (pattern, replacements, group_bases, prescreen,
+    literal_pairs); pattern is None when no rule needs the regex
+    engine. prescreen is a literal-only alternation (Hyperscan-style
+    prefilter) used to reject files cheaply before the full pattern
+    with its lookarounds runs.
+    """
+    alternatives = []
+    replacements = []
+    group_bases = []
+    literals = []
+    literal_pairs = []
+    next_group = 1
+
+    for line in regex_lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        # ungoogled-chromium's domain_regex.list separates pattern and
+        # replacement with '#'; older lists used '@'
+        separator = '@' if '@' in line else '#'
+        parts = line.split(separator, 1)
+        if len(parts) != 2:
+            continue
+        pattern, replacement = parts
+
+        literal = _as_literal(pattern)
+        if literal is not None and '\\g<' not in replacement:
+            literal_pairs.append((literal.encode(), replacement.encode()))
+            literals.append(literal)
+            continue
+
+        offset = next_group
+        replacement = re.sub(
+            r"\\g<(\d+)>",
+            lambda m, offset=offset: f"\\g<{int(m.group(1)) + offset}>",
+            replacement
+        )
+
+        alternatives.append(f"(?P<g{len(group_bases)}>{pattern})".encode())
+        replacements.append(replacement.encode())
+        group_bases.append(offset)
+        literals.append(_literal_prefix(pattern))
+        next_group += 1 + re.compile(pattern).groups
+
+    if not alternatives and not literal_pairs:
+        return None, [], [], None, []
+
+    # The prefilter is only sound if every rule contributed a usable
+    # literal; a rule without one could match a file the filter rejects
+    prescreen = None
+    if all(len(lit) >= 4 for lit in literals):
+        prescreen = re.compile(b'|'.join(
+            re.escape(lit.encode()) for lit in sorted(set(literals))))
+
+    # Compile over bytes: the per-file pass then runs directly on the
+    # mapped file content without a decode/encode round trip
+    pattern = re.compile(b'|'.join(alternatives)) if alternatives else None
+    return pattern, replacements, group_bases, prescreen, literal_pairs
+
+# Fused-rule pickles live here, keyed by rule list content hash
+_RULES_CACHE_DIR = Path.home() / ".cache" / "ungoogled-patcher"
+
+def _compile_domain_rules_cached(regex_lines):
+    """Compile the fused rule set, backed by an on-disk source cache
+
+    re.Pattern objects don't pickle, so the cache stores the built
+    pattern sources plus the replacement tables and recompiles on
+    load — that skips the per-rule parsing, backref renumbering and
+    prefix extraction, which is the bulk of the build. Keyed by a
+    content hash of the rule lines; any corruption just falls through
+    to a fresh compile.
+    """
+    key = hashlib.sha256('\n'.join(regex_lines).encode()).hexdigest()
+    cache_file = _RULES_CACHE_DIR / f"regex-{key}.pkl"
+
+    try:
+        with open(cache_file, 'rb') as f:
+            (fused_source, replacements, group_bases,
+             prescreen_source, literal_pairs) = pickle.load(f)
+        pattern = re.compile(fused_source) if fused_source is not None else None
+        prescreen = (re.compile(prescreen_source)
+                     if prescreen_source is not None else None)
+        return pattern, replacements, group_bases, prescreen, literal_pairs
+    except (OSError, pickle.UnpicklingError, re.error, ValueError, EOFError):
+        pass
+
+    rules = _compile_domain_rules(regex_lines)
+    pattern, replacements, group_bases, prescreen, literal_pairs = rules
+    try:
+        _RULES_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((
+                pattern.pattern if pattern is not None else None,
+                replacements,
+                group_bases,
+                prescreen.pattern if prescreen is not None else None,
+                literal_pairs,
+            ), f)
+        os.replace(tmp_path, cache_file)
+    except OSError as e:
+        logger.debug(f"Could not cache compiled rules: {e}")
+    return rules
+
+# Substitution skips anything larger than this: real source files are
+# far smaller, and big blobs (.pak, ICU data, test corpora) dominate
+# the bytes scanned while never containing substitutable text
+_MAX_SUBSTITUTION_SIZE = 8 * 1024 * 1024
+
+# Compiled rules for substitution worker processes. Set once per worker
+# by the pool initializer so the rule list is not re-pickled per task.
+_worker_rules = None
+
+def _init_substitution_worker(regex_defs):
+    """Pool initializer: compile the fused rule set once per worker"""
+    global _worker_rules
+    _worker_rules = _compile_domain_rules_cached(regex_defs)
+
+_HAVE_FADVISE = hasattr(os, 'posix_fadvise')
+
+# Whether files can be opened relative to a directory fd (POSIX only)
+_HAVE_DIR_FD = os.open in os.supports_dir_fd and hasattr(os, 'O_DIRECTORY')
+
+# Per-worker LRU of open parent-directory fds. Chromium paths are deep
+# and the substitution list is sorted by directory, so opening each
+# parent once and opening files relative to its fd skips most of the
+# kernel's per-component path walk.
+_DIR_FD_CAP = 64
+_worker_dir_fds = OrderedDict()
+
+def _parent_dir_fd(dir_path):
+    """Return a cached fd for a directory (None if it can't be opened)"""
+    fd = _worker_dir_fds.get(dir_path)
+    if fd is not None:
+        _worker_dir_fds.move_to_end(dir_path)
+        return fd
+    try:
+        fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return None
+    _worker_dir_fds[dir_path] = fd
+    if len(_worker_dir_fds) > _DIR_FD_CAP:
+        _, evicted_fd = _worker_dir_fds.popitem(last=False)
+        os.close(evicted_fd)
+    return fd
+
+def _open_for_read(file_path):
+    """Open a file for reading, via its parent's cached fd if possible"""
+    if _HAVE_DIR_FD:
+        dir_fd = _parent_dir_fd(str(file_path.parent))
+        if dir_fd is not None:
+            try:
+                return os.fdopen(
+                    os.open(file_path.name, os.O_RDONLY, dir_fd=dir_fd), 'rb')
+            except OSError:
+                pass
+    return open(file_path, 'rb')
+
+def _fadvise(file_path, advice):
+    """Best-effort page cache hint on a briefly opened fd"""
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, advice)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+def _substitute_batch_worker(file_paths):
+    """Worker entry point for a batch of files' domain substitution
+
+    Keeps a small posix_fadvise(WILLNEED) window ahead of the file
+    being processed so cold-cache reads overlap with regex work, and
+    drops pages with DONTNEED afterwards — these are one-shot reads
+    that shouldn't churn the page cache ahead of the actual build.
+
+    io_uring-style batched read/write was considered here and rejected:
+    Python has no stdlib ring interface and this project deliberately
+    carries no compiled dependencies. The same overlap comes from the
+    WILLNEED window (the kernel services readahead asynchronously while
+    the regex pass runs) fanned across the worker processes, and the
+    mmap scan already avoids read syscalls for the no-match majority.
+    """
+    changed = 0
+    prefetched = 0
+    for i, file_path in enumerate(file_paths):
+        if _HAVE_FADVISE:
+            while prefetched < min(i + 8, len(file_paths)):
+                _fadvise(file_paths[prefetched], os.POSIX_FADV_WILLNEED)
+                prefetched += 1
+        changed += _substitute_domains_in_file(Path(file_path), _worker_rules)
+        if _HAVE_FADVISE:
+            _fadvise(file_path, os.POSIX_FADV_DONTNEED)
+    return changed
+
+def _substitute_domains_in_file(file_path, rules):
+    """Apply the fused domain substitution to a single file"""
+    pattern, replacements, group_bases, prescreen, literal_pairs = rules
+    try:
+        # Search the memory-mapped content first: the large majority of
+        # files contain no target domain, and those now cost one mapped
+        # scan with no allocation and no write-back. The literal-only
+        # prefilter rejects most of them without ever running the full
+        # pattern and its lookarounds.
+        with _open_for_read(file_path) as f:
+            # Gate on size and a NUL check of the first 4 KiB before
+            # scanning anything: binary resources can't meaningfully
+            # contain a domain string, and skipping them up front is
+            # pure memory-bandwidth savings
+            st = os.fstat(f.fileno())
+            if st.st_size > _MAX_SUBSTITUTION_SIZE:
+                return False
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if b'\x00' in mm[:4096]:
+                        return False
+                    if prescreen is not None and prescreen.search(mm) is None:
+                        return False
+                    if ((pattern is None or pattern.search(mm) is None)
+                            and not any(mm.find(find) >= 0
+                                        for find, _ in literal_pairs)):
+                        return False
+                    content = bytes(mm)
+            except ValueError:
+                # Empty file cannot be mapped (and cannot match either)
+                return False
+
+        def _replace(match):
+            # The rule that matched is the one whose wrapper group
+            # contains match.lastindex
+            rule_index = bisect.bisect_right(group_bases, match.lastindex) - 1
+            return match.expand(replacements[rule_index])
+
+        # Literal rules first via bytes.replace (a C substring scan per
+        # rule), then one regex pass over whatever needs real matching
+        new_content = content
+        for find, repl in literal_pairs:
+            new_content = new_content.replace(find, repl)
+        if pattern is not None:
+            new_content = pattern.sub(_replace, new_content)
+
+        if new_content != content:
+            # Rewrite through a temp file so a crash mid-write can't
+            # truncate the original. The temp inherits the original's
+            # permission bits (the list holds plenty of executable
+            # .py/.sh files), and symlinked targets are replaced at
+            # their destination so the link itself survives.
+            dest_path = file_path
+            if os.path.islink(file_path):
+                dest_path = Path(os.path.realpath(file_path))
+            tmp_path = str(dest_path) + '.domsub.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(new_content)
+                if hasattr(os, 'fchmod'):
+                    os.fchmod(f.fileno(), stat.S_IMODE(st.st_mode))
+            os.replace(tmp_path, dest_path)
+            logger.debug(f"Updated: {file_path}")
+            return True
+
+        return False
+
+    except Exception as e:
+        logger.debug(f"Could not process file {file_path}: {e}")
+        return False
+
 class UngoogledPatcher:
     def __init__(self, ungoogled_dir, chromium_dir, verbose=False):
         self.ungoogled_dir = Path(ungoogled_dir)
         self.chromium_dir = Path(chromium_dir)
         self.verbose = verbose
+        self._preload_thread = None
+        self._preloaded = None
         
         # Setup logging
         log_level = logging.DEBUG if verbose else logging.INFO
@@ -108,32 +568,220 @@ class UngoogledPatcher:
         
         if series_file.exists():
             # Use series file if available
-            with open(series_file, 'r') as f:
-                patch_files = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+            patch_files = [line.decode() for line in _read_list(series_file)]
         else:
             # Fall back to all .patch files
             patch_files = [f.name for f in patches_dir.glob("*.patch")]
             patch_files.sort()
         
-        success_count = 0
         total_patches = len(patch_files)
-        
+
         self.logger.info(f"Found {total_patches} patches in {series_name} series")
-        
+
+        patch_paths = []
+        skipped_count = 0
         for patch_file in patch_files:
             patch_path = patches_dir / patch_file
             if not patch_path.exists():
                 self.logger.warning(f"Patch file not found: {patch_file}")
                 continue
-                
-            if self._apply_single_patch(patch_path):
-                success_count += 1
+            if not self._patch_targets_present(patch_path):
+                self.logger.debug(f"Skipping {patch_file}: no target in tree")
+                skipped_count += 1
+                continue
+            patch_paths.append(patch_path)
+
+        if skipped_count:
+            self.logger.info(f"Skipped {skipped_count} patches with no targets in tree")
+
+        # Fast path: concatenate the whole series and hand git one
+        # combined patch — a single diff parse and a single subprocess
+        # for the common case where everything applies cleanly
+        if len(patch_paths) > 1 and self._apply_series_concatenated(patch_paths):
+            self.logger.info(f"Successfully applied {len(patch_paths)}/{total_patches} patches from {series_name}")
+            return len(patch_paths) + skipped_count == total_patches
+
+        # First try to apply the series concurrently: patches touching
+        # disjoint files have no real ordering dependency, the series
+        # order is just an artifact of the list. Any failure (or a patch
+        # whose touched files can't be parsed) falls back to strict
+        # series order for whatever hasn't been applied yet.
+        success_count = 0
+        remaining = patch_paths
+        if len(patch_paths) > 1:
+            applied, clean = self._apply_patches_dag(patch_paths)
+            success_count += len(applied)
+            if clean:
+                remaining = []
             else:
-                self.logger.error(f"Failed to apply patch: {patch_file}")
-                return False
-        
+                remaining = [p for i, p in enumerate(patch_paths)
+                             if i not in applied]
+
+        # Apply patches in batches: git apply accepts several patch files
+        # per invocation, amortizing fork/exec and git startup across the
+        # series instead of paying it once per patch. A failing batch is
+        # bisected back to the per-patch path so error reporting (and the
+        # patch-command fallback) stays per file.
+        batch_size = 32
+        for start in range(0, len(remaining), batch_size):
+            batch = remaining[start:start + batch_size]
+
+            if len(batch) > 1 and self._git_apply_batch(batch):
+                success_count += len(batch)
+                continue
+
+            for patch_path in batch:
+                if self._apply_single_patch(patch_path):
+                    success_count += 1
+                else:
+                    self.logger.error(f"Failed to apply patch: {patch_path.name}")
+                    return False
+
         self.logger.info(f"Successfully applied {success_count}/{total_patches} patches from {series_name}")
-        return success_count == total_patches
+        return success_count + skipped_count == total_patches
+
+    def _patch_targets_present(self, patch_path):
+        """Check whether any file a patch touches exists in the tree
+
+        Series routinely carry patches for other platforms or optional
+        components; git would read and parse the full patch only to
+        reject it. The diff headers answer the same question with a few
+        stat calls. Patches that create files (--- /dev/null) and
+        patches whose headers can't be parsed always pass through so
+        git has the final say.
+        """
+        try:
+            data = patch_path.read_bytes()
+        except OSError:
+            return True
+        pairs = _DIFF_PATHS_RE.findall(data)
+        if not pairs or b'\n--- /dev/null' in data:
+            return True
+        for a_path, b_path in pairs:
+            if ((self.chromium_dir / a_path.decode()).exists()
+                    or (self.chromium_dir / b_path.decode()).exists()):
+                return True
+        return False
+
+    def _apply_series_concatenated(self, patch_paths):
+        """Try the whole series as one concatenated git apply
+
+        Any failure just reports False so the caller falls back to the
+        parallel/batched paths, which bisect down to the failing patch.
+        Patches touching the same file twice in one series won't apply
+        combined; git rejects the second hunk set and we fall back.
+        """
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                    suffix=".patch", delete=False) as tmp:
+                tmp_path = tmp.name
+                for patch_path in patch_paths:
+                    tmp.write(patch_path.read_bytes())
+                    tmp.write(b"\n")
+
+            result = subprocess.run(
+                ["git", "apply", "--ignore-whitespace",
+                 "--ignore-space-change", tmp_path],
+                cwd=self.chromium_dir,
+                capture_output=True,
+                text=True
+            )
+
+            if result.returncode == 0:
+                self.logger.debug(
+                    f"Applied {len(patch_paths)} patches as one concatenated series")
+                return True
+
+            self.logger.debug("Concatenated apply failed, falling back")
+            return False
+
+        except OSError as e:
+            self.logger.debug(f"Could not build concatenated series: {e}")
+            return False
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+
+    def _apply_patches_dag(self, patch_paths):
+        """Apply a patch series concurrently, honoring touched-file deps
+
+        Builds a dependency graph from the "diff --git" headers: patch i
+        depends on the latest earlier patch sharing a touched file. A
+        ready-set scheduler feeds independent patches to a thread pool
+        (the work is subprocess-bound, so threads suffice).
+
+        Returns (applied_indices, clean); clean is False if any patch
+        failed or could not be scheduled, in which case the caller
+        retries the unapplied remainder in strict series order.
+        """
+        touched = [_patch_touched_paths(p) for p in patch_paths]
+        if not all(touched):
+            # A patch without parseable headers can't prove independence
+            self.logger.debug("Unparseable patch headers, applying series serially")
+            return set(), False
+
+        dependents = defaultdict(set)
+        pending_deps = defaultdict(set)
+        last_toucher = {}
+        for i, files in enumerate(touched):
+            for path in files:
+                if path in last_toucher:
+                    pending_deps[i].add(last_toucher[path])
+                    dependents[last_toucher[path]].add(i)
+                last_toucher[path] = i
+
+        applied = set()
+        failed = False
+        futures = {}
+
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+            for i in range(len(patch_paths)):
+                if not pending_deps[i]:
+                    futures[executor.submit(
+                        self._apply_single_patch, patch_paths[i])] = i
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = futures.pop(future)
+                    if not future.result():
+                        # Stop scheduling dependents; already-submitted
+                        # independent patches run to completion
+                        failed = True
+                        continue
+                    applied.add(i)
+                    if failed:
+                        continue
+                    for j in dependents[i]:
+                        pending_deps[j].discard(i)
+                        if not pending_deps[j]:
+                            futures[executor.submit(
+                                self._apply_single_patch, patch_paths[j])] = j
+
+        return applied, not failed and len(applied) == len(patch_paths)
+
+    def _git_apply_batch(self, patch_paths):
+        """Apply a batch of patches with a single git apply invocation"""
+        cmd = ["git", "apply", "--ignore-whitespace", "--ignore-space-change"]
+        cmd.extend(str(p) for p in patch_paths)
+
+        result = subprocess.run(
+            cmd,
+            cwd=self.chromium_dir,
+            capture_output=True,
+            text=True
+        )
+
+        if result.returncode == 0:
+            self.logger.debug(f"Batch-applied {len(patch_paths)} patches")
+            return True
+
+        self.logger.debug("Batch apply failed, bisecting to individual patches")
+        return False
 
     def _apply_single_patch(self, patch_path):
         """Apply a single patch file"""
@@ -194,10 +842,41 @@ class UngoogledPatcher:
             self.logger.error(f"Fallback patch exception: {e}")
             return False
 
+    def _preload_substitution_state(self):
+        """Warm substitution inputs while patch series are applying
+
+        Reads the list files, builds (or loads) the fused rule set and
+        walks the substitution targets, so apply_domain_substitution
+        starts with a hot page/dentry cache and prebuilt candidates.
+        The candidate walk is sound to do early: the substitution list
+        names upstream source files that exist before any patch runs,
+        and pruning only removes files after substitution.
+        """
+        try:
+            regex_lines = _read_list(self.ungoogled_dir / "domain_regex.list")
+            regex_defs = [line.decode() for line in regex_lines]
+            _compile_domain_rules_cached(regex_defs)
+
+            candidates = []
+            for raw_path in _read_list(self.ungoogled_dir / "domain_substitution.list"):
+                target_file = self.chromium_dir / raw_path.decode()
+                if target_file.exists():
+                    candidates.append(str(target_file))
+
+            # Pruning reads this next; parse it while we're here
+            _read_list(self.ungoogled_dir / "pruning.list")
+
+            self._preloaded = {
+                'regex_defs': regex_defs,
+                'candidates': candidates,
+            }
+        except Exception as e:
+            self.logger.debug(f"Substitution preload failed: {e}")
+
     def apply_domain_substitution(self):
         """Apply domain substitution to remove Google dependencies"""
         self.logger.info("Applying domain substitution...")
-        
+
         try:
             # Load domain substitution list
             domain_sub_list = self.ungoogled_dir / "domain_substitution.list"
@@ -211,24 +890,51 @@ class UngoogledPatcher:
                 self.logger.error("domain_regex.list not found") 
                 return False
             
-            # Apply substitutions using ungoogled utilities
-            from utils.substitution import SubstitutionDescriptor
-            
-            # Load substitution mappings
-            with open(domain_regex_list, 'r') as f:
-                regex_defs = f.read().strip().split('\n')
-                
-            with open(domain_sub_list, 'r') as f:
-                sub_files = f.read().strip().split('\n')
-            
-            # Process substitutions
-            substituted_count = 0
-            for file_path in sub_files:
-                if file_path.strip() and not file_path.startswith('#'):
-                    target_file = self.chromium_dir / file_path.strip()
+            # Consume the background preload if one ran; otherwise do
+            # the same work inline
+            preloaded = None
+            if self._preload_thread is not None:
+                self._preload_thread.join()
+                self._preload_thread = None
+                preloaded = self._preloaded
+
+            if preloaded is not None:
+                regex_defs = preloaded['regex_defs']
+                candidates = preloaded['candidates']
+            else:
+                # Load substitution mappings
+                regex_defs = [line.decode() for line in _read_list(domain_regex_list)]
+
+                # Collect candidate files, then fan the independent
+                # read-modify-write operations out across worker processes —
+                # regex work is CPU-bound and GIL-limited in a single process
+                candidates = []
+                for raw_path in _read_list(domain_sub_list):
+                    target_file = self.chromium_dir / raw_path.decode()
                     if target_file.exists():
-                        if self._substitute_domains_in_file(target_file, regex_defs):
-                            substituted_count += 1
+                        candidates.append(str(target_file))
+
+            # Validate the rule set up front before spawning workers
+            fused_pattern, _, _, _, literal_pairs = _compile_domain_rules_cached(regex_defs)
+            if fused_pattern is None and not literal_pairs:
+                self.logger.error("No usable rules in domain_regex.list")
+                return False
+
+            substituted_count = 0
+            if candidates:
+                # Directory-sorted so each batch clusters siblings and
+                # the workers' parent-fd cache gets long hit runs
+                candidates.sort(key=os.path.dirname)
+                # Explicit batches (rather than map chunksize) so each
+                # worker sees its upcoming files and can prefetch them
+                batches = [candidates[start:start + 64]
+                           for start in range(0, len(candidates), 64)]
+                with ProcessPoolExecutor(
+                        max_workers=os.cpu_count(),
+                        initializer=_init_substitution_worker,
+                        initargs=(regex_defs,)) as executor:
+                    substituted_count = sum(
+                        executor.map(_substitute_batch_worker, batches))
             
             self.logger.info(f"Domain substitution applied to {substituted_count} files")
             return True
@@ -237,35 +943,6 @@ class UngoogledPatcher:
             self.logger.error(f"Domain substitution failed: {e}")
             return False
 
-    def _substitute_domains_in_file(self, file_path, regex_defs):
-        """Apply domain substitutions to a single file"""
-        try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            
-            original_content = content
-            
-            # Apply each regex substitution
-            for regex_line in regex_defs:
-                if regex_line.strip() and not regex_line.startswith('#'):
-                    parts = regex_line.strip().split('@')
-                    if len(parts) == 2:
-                        pattern, replacement = parts
-                        content = re.sub(pattern, replacement, content)
-            
-            # Write back if changed
-            if content != original_content:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                self.logger.debug(f"Updated: {file_path}")
-                return True
-            
-            return False
-            
-        except Exception as e:
-            self.logger.debug(f"Could not process file {file_path}: {e}")
-            return False
-
     def apply_pruning(self):
         """Apply pruning list to remove unwanted files"""
         self.logger.info("Applying pruning list...")
@@ -276,23 +953,35 @@ class UngoogledPatcher:
                 self.logger.error("pruning.list not found")
                 return False
             
-            with open(pruning_list, 'r') as f:
-                prune_paths = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+            prune_paths = [line.decode() for line in _read_list(pruning_list)]
             
+            # Pruning is syscall-bound: one pool serves both the plain
+            # file unlinks (submitted directly) and the per-tree file
+            # removals inside _prune_tree. Directory trees are walked
+            # from this thread so only leaf unlinks ever block a worker.
             pruned_count = 0
-            for prune_path in prune_paths:
-                target_path = self.chromium_dir / prune_path
-                
-                if target_path.exists():
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                file_futures = []
+                for prune_path in prune_paths:
+                    target_path = self.chromium_dir / prune_path
+
                     if target_path.is_dir():
-                        shutil.rmtree(target_path)
+                        _prune_tree(target_path, executor)
                         self.logger.debug(f"Removed directory: {prune_path}")
+                        pruned_count += 1
+                    elif target_path.exists():
+                        file_futures.append(
+                            (prune_path, executor.submit(target_path.unlink)))
                     else:
-                        target_path.unlink()
+                        self.logger.debug(f"Prune target not found: {prune_path}")
+
+                for prune_path, future in file_futures:
+                    try:
+                        future.result()
                         self.logger.debug(f"Removed file: {prune_path}")
-                    pruned_count += 1
-                else:
-                    self.logger.debug(f"Prune target not found: {prune_path}")
+                        pruned_count += 1
+                    except OSError as e:
+                        self.logger.debug(f"Could not remove {prune_path}: {e}")
             
             self.logger.info(f"Pruned {pruned_count} items")
             return True
@@ -311,23 +1000,45 @@ class UngoogledPatcher:
                 self.logger.error("flags.gn not found")
                 return False
             
-            # Read ungoogled flags
-            with open(flags_file, 'r') as f:
-                ungoogled_flags = f.read()
-            
             # Append to existing args.gn or create new one
             args_file = self.chromium_dir / "out" / "Ultimate" / "args.gn"
             args_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Check if args.gn already exists (from merged config)
+
+            # Check if args.gn already exists (from merged config).
+            # The flags append in binary with sendfile where available:
+            # the file content moves kernel-side without the text-mode
+            # decode/encode round trip. The destination is opened
+            # read-write and positioned at the end rather than 'ab' —
+            # sendfile rejects an O_APPEND out_fd with EINVAL.
             if args_file.exists():
-                with open(args_file, 'a') as f:
-                    f.write('\n\n# Ungoogled-Chromium specific flags\n')
-                    f.write(ungoogled_flags)
+                header = b'\n\n# Ungoogled-Chromium specific flags\n'
+                dst_mode = 'r+b'
             else:
-                with open(args_file, 'w') as f:
-                    f.write('# Ungoogled-Chromium build flags\n')
-                    f.write(ungoogled_flags)
+                header = b'# Ungoogled-Chromium build flags\n'
+                dst_mode = 'w+b'
+
+            with open(flags_file, 'rb') as src, open(args_file, dst_mode) as dst:
+                dst.seek(0, os.SEEK_END)
+                dst.write(header)
+                dst.flush()
+                size = os.fstat(src.fileno()).st_size
+                offset = 0
+                try:
+                    while offset < size:
+                        sent = os.sendfile(dst.fileno(), src.fileno(),
+                                           offset, size - offset)
+                        if sent == 0:
+                            break
+                        offset += sent
+                except (AttributeError, OSError):
+                    pass
+                if offset < size:
+                    # No sendfile, or it stopped short — resume the
+                    # plain buffered copy from where it left off so
+                    # already-sent bytes aren't duplicated
+                    src.seek(offset)
+                    dst.seek(0, os.SEEK_END)
+                    shutil.copyfileobj(src, dst)
             
             self.logger.info("Build flags applied")
             return True
@@ -336,10 +1047,32 @@ class UngoogledPatcher:
             self.logger.error(f"Failed to apply build flags: {e}")
             return False
 
+    def _verification_cache_file(self):
+        """Location of the marker-scan cache inside the chromium tree"""
+        return self.chromium_dir / ".ungoogled-cache" / "verify.json"
+
+    def _load_verification_cache(self):
+        """Load cached marker-scan results (empty dict if unavailable)"""
+        try:
+            with open(self._verification_cache_file(), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_verification_cache(self, cache):
+        """Persist marker-scan results for the next run"""
+        try:
+            cache_file = self._verification_cache_file()
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_file, 'w') as f:
+                json.dump(cache, f)
+        except OSError as e:
+            self.logger.debug(f"Could not save verification cache: {e}")
+
     def verify_patches(self):
         """Verify that patches were applied successfully"""
         self.logger.info("Verifying patch application...")
-        
+
         verification_markers = [
             # Look for ungoogled-chromium specific changes
             ("chrome/browser/chrome_browser_main.cc", "ungoogled-chromium"),
@@ -347,44 +1080,115 @@ class UngoogledPatcher:
             # Check for removed Google services
             ("google_apis/BUILD.gn", False),  # Should be modified/removed
         ]
-        
+
+        # Marker scans are memoized on (path, marker, size, mtime) so
+        # repeated runs only re-read files a patch actually touched
+        cache = self._load_verification_cache()
+        cache_dirty = False
+
         verified_count = 0
         for file_path, marker in verification_markers:
             target_file = self.chromium_dir / file_path
-            
+
             if target_file.exists():
                 try:
-                    with open(target_file, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                    
-                    if marker is False:
-                        # File should be modified (not contain original content)
-                        verified_count += 1
-                    elif marker in content:
+                    st = target_file.stat()
+                    cache_key = f"{file_path}|{marker}|{st.st_size}|{st.st_mtime_ns}"
+                    verified = cache.get(cache_key)
+
+                    if verified is None:
+                        with open(target_file, 'r', encoding='utf-8', errors='ignore') as f:
+                            content = f.read()
+
+                        if marker is False:
+                            # File should be modified (not contain original content)
+                            verified = True
+                        else:
+                            verified = marker in content
+                        cache[cache_key] = verified
+                        cache_dirty = True
+
+                    if verified:
                         verified_count += 1
                         self.logger.debug(f"Verified marker in: {file_path}")
                 except:
                     pass
-        
+
+        if cache_dirty:
+            self._save_verification_cache(cache)
+
         self.logger.info(f"Verified {verified_count}/{len(verification_markers)} patch markers")
         return verified_count > 0
 
+    def _patch_series_overlap(self):
+        """Check whether the three patch series share any target file
+
+        Patches are enumerated exactly as _apply_patch_series applies
+        them — series file first (whose entries are nested paths like
+        core/bromite/...), recursive glob otherwise — so the
+        disjointness check covers what actually runs. Anything
+        unprovable counts as an overlap: a patch that can't be parsed,
+        or a series that exists but enumerates no patches at all.
+        """
+        seen = set()
+        for series in ("core", "extra", "inox-patchset"):
+            patches_dir = self.ungoogled_dir / "patches" / series
+            if not patches_dir.exists():
+                continue
+            series_file = patches_dir / "series"
+            if series_file.exists():
+                patch_paths = [patches_dir / line.decode()
+                               for line in _read_list(series_file)]
+            else:
+                patch_paths = sorted(patches_dir.rglob("*.patch"))
+            if not patch_paths:
+                return True
+            series_paths = set()
+            for patch_path in patch_paths:
+                touched = _patch_touched_paths(patch_path)
+                if not touched:
+                    return True
+                series_paths |= touched
+            if series_paths & seen:
+                return True
+            seen |= series_paths
+        return False
+
     def run_all(self):
         """Execute complete ungoogled-chromium patching process"""
         self.logger.info("Starting complete ungoogled-chromium patch application...")
-        
+
         success_steps = []
-        
-        # Apply all patch series
-        if self.apply_core_patches():
-            success_steps.append("core patches")
-            
-        if self.apply_extra_patches():
-            success_steps.append("extra patches")
-            
-        if self.apply_inox_patches():
-            success_steps.append("inox patches")
-        
+
+        # Substitution's inputs don't depend on the patch series, so
+        # their reads and the rule compile overlap the subprocess-heavy
+        # patching instead of running cold afterwards
+        self._preload_thread = threading.Thread(
+            target=self._preload_substitution_state, daemon=True)
+        self._preload_thread.start()
+
+        # The three patch series touch largely disjoint subtrees, so
+        # their sequential ordering is an artifact of the script; run
+        # them in parallel threads (the work is subprocess-bound) and
+        # keep the serial order only when their targets actually overlap
+        series_steps = [
+            ("core patches", self.apply_core_patches),
+            ("extra patches", self.apply_extra_patches),
+            ("inox patches", self.apply_inox_patches),
+        ]
+
+        if self._patch_series_overlap():
+            self.logger.debug("Patch series share targets, applying serially")
+            for step_name, apply_step in series_steps:
+                if apply_step():
+                    success_steps.append(step_name)
+        else:
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                results = executor.map(lambda step: step[1](), series_steps)
+                for (step_name, _), step_ok in zip(series_steps, results):
+                    if step_ok:
+                        success_steps.append(step_name)
+
         # Apply domain substitution
         if self.apply_domain_substitution():
             success_steps.append("domain substitution")
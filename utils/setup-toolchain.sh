@@ -146,19 +146,27 @@ clone_llvm() {
 
 # Configure LLVM build with all optimizations
 configure_llvm() {
-    log_info "Configuring LLVM with maximum optimizations..."
-    
+    log_info "Configuring two-stage PGO LLVM build..."
+
     cd "$TOOLCHAIN_DIR/build"
-    
-    # CMake configuration for optimized LLVM
+
+    # Two-stage PGO via upstream's PGO.cmake cache: stage1 bootstrap,
+    # IR-instrumented stage2, training run to generate profile data, then
+    # the final stage2 built with -fprofile-use. This is half the rebuilds
+    # of the four-stage default while keeping the documented 10-20% Clang
+    # speedup. -vp-counters-per-site avoids profile counter overflow on
+    # the heavily-inlined training workload.
     cmake -G Ninja \
+        -C ../src/llvm-project/clang/cmake/caches/PGO.cmake \
         -DCMAKE_BUILD_TYPE=Release \
         -DCMAKE_INSTALL_PREFIX="$TOOLCHAIN_DIR/install" \
+        -DBOOTSTRAP_LLVM_BUILD_INSTRUMENTED=IR \
+        -DBOOTSTRAP_CMAKE_CXX_FLAGS="-mllvm -vp-counters-per-site=256" \
+        -DCLANG_BOOTSTRAP_PASSTHROUGH="CMAKE_INSTALL_PREFIX;LLVM_PARALLEL_LINK_JOBS;LLVM_ENABLE_ZLIB;LLVM_ENABLE_ZSTD;LLVM_POLLY_LINK_INTO_TOOLS" \
         -DLLVM_ENABLE_PROJECTS="clang;clang-tools-extra;lld;polly;bolt" \
         -DLLVM_ENABLE_RUNTIMES="compiler-rt" \
         -DLLVM_TARGETS_TO_BUILD="X86;AArch64" \
         -DLLVM_ENABLE_ASSERTIONS=OFF \
-        -DLLVM_ENABLE_LTO=Thin \
         -DLLVM_USE_SPLIT_DWARF=ON \
         -DLLVM_OPTIMIZED_TABLEGEN=ON \
         -DLLVM_ENABLE_ZLIB=ON \
@@ -176,19 +184,23 @@ configure_llvm() {
         -DCMAKE_C_FLAGS="-O3 -DNDEBUG" \
         -DCMAKE_CXX_FLAGS="-O3 -DNDEBUG" \
         ../src/llvm-project/llvm
-    
+
     log_success "LLVM configuration complete"
 }
 
 # Build optimized LLVM toolchain
 build_llvm() {
-    log_info "Building optimized LLVM toolchain (this will take a while)..."
-    
+    log_info "Building two-stage PGO LLVM toolchain (this will take a while)..."
+
     cd "$TOOLCHAIN_DIR/build"
-    
-    # Build with maximum parallelism but limit memory usage
-    ninja -j $(nproc) install
-    
+
+    # Stage 2a: build the instrumented compiler and generate profile data
+    # from the in-tree training workload
+    ninja -j $(nproc) stage2-instrumented-generate-profdata
+
+    # Stage 2b: final compiler built with the merged profile
+    ninja -j $(nproc) stage2-install
+
     log_success "LLVM toolchain built and installed"
 }
 